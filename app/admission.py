@@ -0,0 +1,128 @@
+import time
+import shutil
+import asyncio
+from collections import deque
+from typing import Optional
+from config import (
+    MIN_FREE_DISK_MB, MAX_INFLIGHT_MB, ADMISSION_MAX_WAIT_SECONDS,
+    DEFAULT_VIDEO_JOB_MB, DEFAULT_AUDIO_JOB_MB, MAX_CONCURRENT_DOWNLOADS,
+)
+
+class AdmissionTicket:
+    def __init__(self, mode: str, reserved_mb: float):
+        self.mode = mode
+        self.reserved_mb = reserved_mb
+        # Set once the download actually starts transferring, not when it is admitted
+        self.started_at = None
+
+    def mark_started(self):
+        self.started_at = time.monotonic()
+
+class AdmissionController:
+    """Decides whether a download may start given free disk space and bytes already in flight"""
+
+    def __init__(self, downloads_dir: str = "downloads"):
+        self.downloads_dir = downloads_dir
+        self.in_flight_mb = 0.0
+        self.jobs_in_flight = 0
+        self.queued_mb = 0.0
+        # Jobs waiting in admit(), oldest first; they are admitted in this order
+        self._waiters = deque()
+        self.recent_sizes = {"video": deque(maxlen=20), "audio": deque(maxlen=20)}
+        # Rolling per-job download throughput in MB/s, None until the first job finishes
+        self.throughput_mbps = None
+        self._condition = asyncio.Condition()
+
+    def estimate_job_mb(self, audio_only: bool) -> float:
+        mode = "audio" if audio_only else "video"
+        sizes = self.recent_sizes[mode]
+        if sizes:
+            return sum(sizes) / len(sizes)
+        return DEFAULT_AUDIO_JOB_MB if audio_only else DEFAULT_VIDEO_JOB_MB
+
+    def free_disk_mb(self) -> float:
+        return shutil.disk_usage(self.downloads_dir).free / (1024 * 1024)
+
+    def has_disk_for(self, job_mb: float) -> bool:
+        return self.free_disk_mb() - self.in_flight_mb - job_mb >= MIN_FREE_DISK_MB
+
+    def can_start(self, job_mb: float) -> bool:
+        if not self.has_disk_for(job_mb):
+            return False
+        # A single job is always allowed through so one large video cannot block forever
+        return self.jobs_in_flight == 0 or self.in_flight_mb + job_mb <= MAX_INFLIGHT_MB
+
+    def estimate_wait_seconds(self, job_mb: float) -> Optional[float]:
+        """Seconds until the queue ahead drains, or None before any throughput has been observed"""
+        if self.can_start(job_mb):
+            return 0.0
+        if not self.has_disk_for(job_mb) and self.jobs_in_flight == 0:
+            # Nothing in flight will free the space; only the hourly cleanup can
+            return float("inf")
+        if not self.throughput_mbps:
+            return None
+        return (self.in_flight_mb + self.queued_mb) / (self.throughput_mbps * MAX_CONCURRENT_DOWNLOADS)
+
+    def try_admit(self, audio_only: bool) -> Optional[AdmissionTicket]:
+        """Reserve room for a job if it can start right away"""
+        job_mb = self.estimate_job_mb(audio_only)
+        # New arrivals must not jump ahead of jobs already waiting
+        if self._waiters or not self.can_start(job_mb):
+            return None
+        return self._reserve(audio_only, job_mb)
+
+    async def admit(self, audio_only: bool, timeout: float = ADMISSION_MAX_WAIT_SECONDS) -> AdmissionTicket:
+        """Wait until there is room for a job, then reserve it; raises asyncio.TimeoutError"""
+        job_mb = self.estimate_job_mb(audio_only)
+        deadline = time.monotonic() + timeout
+        turn = object()
+        async with self._condition:
+            self.queued_mb += job_mb
+            self._waiters.append(turn)
+            try:
+                while self._waiters[0] is not turn or not self.can_start(job_mb):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    # Re-check periodically too: disk space also frees up when cleanup runs
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout=min(remaining, 5))
+                    except asyncio.TimeoutError:
+                        pass
+                return self._reserve(audio_only, job_mb)
+            finally:
+                self.queued_mb -= job_mb
+                self._waiters.remove(turn)
+                # Started or gave up, either way the next job in line gets to check
+                self._condition.notify_all()
+
+    def _reserve(self, audio_only: bool, job_mb: float) -> AdmissionTicket:
+        self.in_flight_mb += job_mb
+        self.jobs_in_flight += 1
+        return AdmissionTicket("audio" if audio_only else "video", job_mb)
+
+    async def release(self, ticket: AdmissionTicket, actual_mb: Optional[float] = None):
+        """Free a job's reservation and feed its real size and speed into the estimates"""
+        self.in_flight_mb = max(0.0, self.in_flight_mb - ticket.reserved_mb)
+        self.jobs_in_flight = max(0, self.jobs_in_flight - 1)
+        if actual_mb:
+            self.recent_sizes[ticket.mode].append(actual_mb)
+        if actual_mb and ticket.started_at is not None:
+            # Transfer time only: waiting for a download slot would make every job look slow
+            elapsed = max(time.monotonic() - ticket.started_at, 0.001)
+            rate = actual_mb / elapsed
+            self.throughput_mbps = rate if self.throughput_mbps is None else 0.7 * self.throughput_mbps + 0.3 * rate
+        async with self._condition:
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "free_disk_mb": round(self.free_disk_mb(), 1),
+            "in_flight_mb": round(self.in_flight_mb, 1),
+            "jobs_in_flight": self.jobs_in_flight,
+            "queued_mb": round(self.queued_mb, 1),
+            "jobs_waiting": len(self._waiters),
+            "throughput_mbps": round(self.throughput_mbps, 2) if self.throughput_mbps else None,
+        }
+
+admission = AdmissionController()
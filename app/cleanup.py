@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 import asyncio
 from config import FILE_RETENTION_HOURS, CLOUDINARY_RETENTION_HOURS
 from app.cloud import cleanup_cloudinary_files
+from app.jobs import job_queue
 
 async def cleanup_old_files():
     """Remove files older than FILE_RETENTION_HOURS locally and on Cloudinary"""
@@ -18,9 +19,10 @@ async def cleanup_old_files():
                         print(f"Removed old file: {filename}")
                     except Exception as e:
                         print(f"Error removing file {filename}: {str(e)}")
+            await job_queue.purge()
             # Cloudinary cleanup
             print("Running Cloudinary cleanup task...")
-            cleanup_cloudinary_files(retention_hours=CLOUDINARY_RETENTION_HOURS)
+            await asyncio.to_thread(cleanup_cloudinary_files, retention_hours=CLOUDINARY_RETENTION_HOURS)
         except Exception as e:
             print(f"Error in cleanup: {str(e)}")
         await asyncio.sleep(3600)  # Run every hour 
\ No newline at end of file
@@ -1,17 +1,21 @@
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 from config import CLOUDINARY_RETENTION_HOURS
 from datetime import datetime, timedelta
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
-cloudinary.config(secure=True)
-
 executor = ThreadPoolExecutor()
 
+def _cloudinary():
+    """Import and configure the Cloudinary SDK on first use instead of at startup"""
+    import cloudinary
+    import cloudinary.api
+    import cloudinary.uploader
+    cloudinary.config(secure=True)
+    return cloudinary
+
 def upload_to_cloudinary(file_path, folder="wa-downloads"):
     """Uploads a file to Cloudinary and returns the URL and public_id."""
+    cloudinary = _cloudinary()
     response = cloudinary.uploader.upload(
         file_path,
         resource_type="video",
@@ -28,6 +32,7 @@ async def async_upload_to_cloudinary(file_path, folder="wa-downloads"):
 
 def cleanup_cloudinary_files(folder="wa-downloads", retention_hours=CLOUDINARY_RETENTION_HOURS):
     """Deletes Cloudinary files older than retention_hours in the given folder."""
+    cloudinary = _cloudinary()
     cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
     resources = cloudinary.api.resources(type="upload", prefix=folder, resource_type="video", max_results=500)
     for res in resources.get("resources", []):
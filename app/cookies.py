@@ -0,0 +1,176 @@
+import os
+import re
+import glob
+import time
+import base64
+import logging
+import threading
+import http.cookiejar
+from contextlib import contextmanager
+from typing import Optional
+from config import COOKIES_DIR, COOKIES_RUNTIME_DIR, COOKIE_QUARANTINE_MINUTES
+
+logger = logging.getLogger(__name__)
+
+PLATFORMS = ("youtube", "facebook")
+
+# Error text that means the platform has flagged the account rather than the video.
+# Video-level reasons such as YouTube's "Sign in to confirm your age" or a private
+# video needing a login must not match, or they would quarantine healthy accounts.
+CHECKPOINT_MARKERS = (
+    "checkpoint",
+    "not a bot",
+    "http error 429",
+    "too many requests",
+    "rate-limit",
+    "rate limit",
+)
+
+def is_checkpoint_error(error) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in CHECKPOINT_MARKERS)
+
+class CookieIdentity:
+    """One account's cookies, parsed once and shared by every job that uses it"""
+
+    def __init__(self, name: str, platform: str, path: str, cookies: dict):
+        self.name = name
+        self.platform = platform
+        self.path = path
+        self.cookies = cookies
+        self.in_use = 0
+        self.last_used = 0.0
+        self.jobs = 0
+        self.checkpoints = 0
+        self.quarantined_until = 0.0
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.quarantined_until
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "name": self.name,
+            "platform": self.platform,
+            "in_use": self.in_use,
+            "jobs": self.jobs,
+            "checkpoints": self.checkpoints,
+            "quarantined_for_seconds": max(0, round(self.quarantined_until - now)),
+        }
+
+class CookiePool:
+    """Spreads jobs across cookie identities and quarantines the ones that get checkpointed"""
+
+    def __init__(self, identities: list):
+        self.identities = identities
+        self._lock = threading.Lock()
+
+    def acquire(self, platform: str) -> Optional[CookieIdentity]:
+        """Pick the least busy, least recently used healthy identity for a platform"""
+        now = time.time()
+        with self._lock:
+            candidates = [
+                identity for identity in self.identities
+                if identity.platform == platform and identity.is_healthy(now)
+            ]
+            if not candidates:
+                return None
+            identity = min(candidates, key=lambda i: (i.in_use, i.last_used))
+            identity.in_use += 1
+            identity.jobs += 1
+            identity.last_used = now
+            return identity
+
+    def release(self, identity: Optional[CookieIdentity], error=None):
+        """Return an identity after a job, quarantining it if the job hit a checkpoint"""
+        if identity is None:
+            return
+        with self._lock:
+            identity.in_use = max(0, identity.in_use - 1)
+            if error is not None and is_checkpoint_error(error):
+                identity.checkpoints += 1
+                # Back off harder each time the same account is flagged again
+                minutes = COOKIE_QUARANTINE_MINUTES * 2 ** (identity.checkpoints - 1)
+                identity.quarantined_until = time.time() + minutes * 60
+                logger.warning(f"Cookie identity {identity.name} quarantined for {minutes} minutes: {error}")
+            elif error is None:
+                identity.checkpoints = 0
+
+    @contextmanager
+    def borrow(self, platform: Optional[str]):
+        """Acquire an identity for the duration of a job and report how the job went"""
+        identity = self.acquire(platform) if platform else None
+        try:
+            yield identity
+        except Exception as e:
+            self.release(identity, error=e)
+            raise
+        self.release(identity)
+
+    def stats(self) -> list:
+        now = time.time()
+        with self._lock:
+            return [identity.to_dict(now) for identity in self.identities]
+
+def _parse_cookie_file(path: str) -> dict:
+    jar = http.cookiejar.MozillaCookieJar()
+    jar.load(path, ignore_discard=True, ignore_expires=True)
+    return {c.name: c.value for c in jar}
+
+def _env_cookie_contents(platform: str) -> list:
+    """Return (name, base64 content) pairs from PLATFORM_COOKIES_CONTENT and PLATFORM_COOKIES_CONTENT_<n>"""
+    prefix = f"{platform.upper()}_COOKIES_CONTENT"
+    pattern = re.compile(rf"^{prefix}(?:_(\d+))?$")
+    found = {}
+    for key, value in sorted(os.environ.items()):
+        match = pattern.match(key)
+        if not match or not value.strip():
+            continue
+        # The unsuffixed variable is account 0, so it can't collide with _1
+        index = int(match.group(1) or 0)
+        if index in found:
+            logger.warning(f"Ignoring {key}: another {prefix} variable already uses index {index}")
+            continue
+        found[index] = value
+    return [(f"{platform}_env_{index}", value) for index, value in sorted(found.items())]
+
+def load_cookie_identities() -> list:
+    """Create and parse every configured cookie identity"""
+    identities = []
+    os.makedirs(COOKIES_RUNTIME_DIR, exist_ok=True)
+    for platform in PLATFORMS:
+        sources = []
+        for name, content in _env_cookie_contents(platform):
+            try:
+                decoded = base64.b64decode(content.strip())
+                if not decoded.startswith(b"# Netscape HTTP Cookie File"):
+                    logger.warning(f"Decoded cookies for {name} do not start with Netscape header")
+                path = os.path.join(COOKIES_RUNTIME_DIR, f"{name}.txt")
+                with open(path, 'wb') as f:
+                    f.write(decoded)
+                sources.append((name, path))
+            except Exception as e:
+                logger.error(f"Error creating cookies file for {name}: {e}")
+        if COOKIES_DIR:
+            for path in sorted(glob.glob(os.path.join(COOKIES_DIR, f"{platform}*.txt"))):
+                sources.append((f"{platform}_file_{os.path.basename(path)}", path))
+        for name, path in sources:
+            try:
+                identities.append(CookieIdentity(name, platform, path, _parse_cookie_file(path)))
+            except Exception as e:
+                logger.error(f"Error parsing cookies file {path}: {e}")
+    for platform in PLATFORMS:
+        count = sum(1 for identity in identities if identity.platform == platform)
+        logger.info(f"Loaded {count} {platform} cookie identities")
+    return identities
+
+_cookie_pool = None
+_cookie_pool_lock = threading.Lock()
+
+def get_cookie_pool() -> CookiePool:
+    """Return the process-wide cookie pool, loading identities on first use"""
+    global _cookie_pool
+    if _cookie_pool is None:
+        with _cookie_pool_lock:
+            if _cookie_pool is None:
+                _cookie_pool = CookiePool(load_cookie_identities())
+    return _cookie_pool
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import random
+from collections import deque
+from datetime import datetime
+from typing import NamedTuple, Optional
+from config import DELIVERY_LOG_PATH
+
+# WhatsApp rejects video/audio messages above this size
+WHATSAPP_MEDIA_LIMIT_MB = 16
+# Size to aim for when transcoding, leaving headroom under the limit
+TRANSCODE_TARGET_MB = 15
+TRANSCODE_AUDIO_KBPS = 64
+MIN_TRANSCODE_VIDEO_KBPS = 200
+
+# (latency seconds, MB per second) assumed until uploads have been observed. Both destinations
+# start equal so, before there is real data, files under the limit go to chat as they always did
+DEFAULT_ESTIMATES = {
+    "whatsapp": (2.0, 1.0),
+    "cloudinary": (2.0, 1.0),
+}
+# A link needs an extra tap and a browser page load before anything plays
+LINK_OPEN_SECONDS = 5.0
+# Seconds of media transcoded per wall-clock second before any transcode has been observed
+DEFAULT_TRANSCODE_SPEED = 4.0
+# Upload samples older than this are forgotten, so one slow period doesn't decide forever
+SAMPLE_MAX_AGE_SECONDS = 30 * 60
+# Share of link-only decisions sent to chat anyway, so the WhatsApp estimate keeps learning
+EXPLORE_RATE = 0.1
+
+class UploadEstimator:
+    """Rolling fit of upload time = latency + size / throughput for one destination"""
+
+    def __init__(self, latency: float, throughput_mbps: float, window: int = 20):
+        self.default_latency = latency
+        self.default_throughput = throughput_mbps
+        self.samples = deque(maxlen=window)
+
+    def observe(self, size_mb: float, seconds: float):
+        self.samples.append((size_mb, seconds, time.monotonic()))
+
+    def recent_samples(self) -> list:
+        cutoff = time.monotonic() - SAMPLE_MAX_AGE_SECONDS
+        return [(size, seconds) for size, seconds, at in self.samples if at >= cutoff]
+
+    def estimate(self) -> tuple:
+        """Return (latency seconds, throughput MB/s) from recent uploads"""
+        samples = self.recent_samples()
+        if not samples:
+            return self.default_latency, self.default_throughput
+        n = len(samples)
+        mean_size = sum(size for size, _ in samples) / n
+        mean_seconds = sum(seconds for _, seconds in samples) / n
+        variance = sum((size - mean_size) ** 2 for size, _ in samples)
+        if n >= 3 and variance > 1.0:
+            # Least-squares line through (size, seconds): the slope is seconds per MB
+            slope = sum((size - mean_size) * (seconds - mean_seconds) for size, seconds in samples) / variance
+            latency = mean_seconds - slope * mean_size
+            if slope > 0 and latency >= 0:
+                return latency, 1 / slope
+        # Too few or too similar samples for a fit: keep the default latency, learn throughput
+        transfer_seconds = max(mean_seconds - self.default_latency, 0.1)
+        return self.default_latency, mean_size / transfer_seconds
+
+    def predict(self, size_mb: float) -> float:
+        latency, throughput = self.estimate()
+        return latency + size_mb / throughput
+
+class DeliveryPlan(NamedTuple):
+    mode: str
+    size_mb: float
+    duration: Optional[float]
+    estimates: dict
+    video_kbps: Optional[int] = None
+
+class DeliveryPlanner:
+    """Chooses direct send, transcode-then-send or link-only by predicted time to first playable"""
+
+    def __init__(self):
+        self.uploads = {
+            destination: UploadEstimator(latency, throughput)
+            for destination, (latency, throughput) in DEFAULT_ESTIMATES.items()
+        }
+        self.transcode_speed = DEFAULT_TRANSCODE_SPEED
+        self.history = deque(maxlen=100)
+
+    def transcode_bitrate(self, duration: Optional[float]) -> Optional[int]:
+        """Video bitrate (kbps) that fits `duration` seconds under the target size, if watchable"""
+        if not duration:
+            return None
+        total_kbps = TRANSCODE_TARGET_MB * 8 * 1024 / duration
+        video_kbps = int(total_kbps * 0.95 - TRANSCODE_AUDIO_KBPS)
+        return video_kbps if video_kbps >= MIN_TRANSCODE_VIDEO_KBPS else None
+
+    def choose(self, size_mb: float, duration: Optional[float], audio_only: bool) -> DeliveryPlan:
+        estimates = {}
+        video_kbps = None
+        if size_mb < WHATSAPP_MEDIA_LIMIT_MB:
+            estimates["direct"] = self.uploads["whatsapp"].predict(size_mb)
+        elif not audio_only:
+            video_kbps = self.transcode_bitrate(duration)
+            if video_kbps:
+                estimates["transcode"] = (
+                    duration / self.transcode_speed + self.uploads["whatsapp"].predict(TRANSCODE_TARGET_MB)
+                )
+        # Added last so a tie goes to the in-chat options
+        estimates["link"] = self.uploads["cloudinary"].predict(size_mb) + LINK_OPEN_SECONDS
+        mode = min(estimates, key=estimates.get)
+        explored = ""
+        if mode == "link" and len(estimates) > 1 and random.random() < EXPLORE_RATE:
+            # Cloudinary is measured on every job because the link is always sent; WhatsApp is only
+            # measured when chat is chosen, so occasionally choose it to keep its estimate current
+            mode = min((k for k in estimates if k != "link"), key=estimates.get)
+            explored = ", exploring"
+        plan = DeliveryPlan(mode, size_mb, duration, {k: round(v, 1) for k, v in estimates.items()}, video_kbps)
+        print(f"Delivery plan for {size_mb:.2f} MB: {mode} (predicted seconds: {plan.estimates}{explored})")
+        return plan
+
+    def observe_upload(self, destination: str, size_mb: float, seconds: float):
+        self.uploads[destination].observe(size_mb, seconds)
+
+    def observe_transcode(self, duration: float, seconds: float):
+        speed = duration / max(seconds, 0.1)
+        self.transcode_speed = 0.7 * self.transcode_speed + 0.3 * speed
+
+    def record(self, plan: DeliveryPlan, first_playable_seconds: Optional[float], delivered: str):
+        """Log a decision next to what actually happened, in memory and to DELIVERY_LOG_PATH"""
+        entry = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "mode": plan.mode,
+            "size_mb": round(plan.size_mb, 2),
+            "duration": plan.duration,
+            "predicted_seconds": plan.estimates,
+            "first_playable_seconds": round(first_playable_seconds, 1) if first_playable_seconds is not None else None,
+            "delivered": delivered,
+        }
+        self.history.append(entry)
+        print(f"Delivery outcome: {entry}")
+        if DELIVERY_LOG_PATH:
+            try:
+                os.makedirs(os.path.dirname(DELIVERY_LOG_PATH) or ".", exist_ok=True)
+                with open(DELIVERY_LOG_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except Exception as e:
+                print(f"Error writing delivery log: {str(e)}")
+
+    def report(self) -> dict:
+        estimates = {}
+        for destination, estimator in self.uploads.items():
+            latency, throughput = estimator.estimate()
+            estimates[destination] = {
+                "latency_seconds": round(latency, 2),
+                "throughput_mbps": round(throughput, 2),
+                "samples": len(estimator.recent_samples()),
+            }
+        return {
+            "estimates": estimates,
+            "transcode_speed": round(self.transcode_speed, 2),
+            "recent": list(self.history),
+        }
+
+delivery_planner = DeliveryPlanner()
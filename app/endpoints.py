@@ -1,26 +1,35 @@
 import os
+import re
 import time
 import asyncio
+import threading
 from typing import Dict, Optional
 from fastapi import APIRouter, Request, Response, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from pydantic import BaseModel
-from app.video import download_video
-from app.whatsapp import send_message, send_video
+from app.video import download_video, expand_playlist, probe_duration, transcode_for_chat
+from app.whatsapp import send_video, send_audio
+from app.outbox import outbox, queue_message
 from app.cloud import async_upload_to_cloudinary
-from app.utils import setup_cookies
-from config import VERIFY_TOKEN, MESSAGE_CACHE_TTL
+from app.delivery import delivery_planner, WHATSAPP_MEDIA_LIMIT_MB, TRANSCODE_AUDIO_KBPS, LINK_OPEN_SECONDS
+from app.platforms import classify_url
+from app.admission import admission
+from app.monitor import loop_monitor, profiler
+from app.jobs import job_queue
+from config import VERIFY_TOKEN, MESSAGE_CACHE_TTL, MAX_URLS_PER_MESSAGE, ADMISSION_MAX_WAIT_SECONDS, WORKER_MODE
 
 router = APIRouter()
 
 # Pydantic models for API documentation
 class TestDownloadRequest(BaseModel):
     url: str
+    audio_only: bool = False
     
     model_config = {
         "json_schema_extra": {
             "example": {
-                "url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+                "url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+                "audio_only": False
             }
         }
     }
@@ -45,117 +54,264 @@ class WebhookResponse(BaseModel):
 # Message cache to prevent duplicate processing
 message_cache = {}
 
-# Create cookies files at startup
-youtube_cookies_path, facebook_cookies_path = setup_cookies()
+# Words that switch a request to audio-only mode, e.g. "audio https://youtu.be/...".
+# They only count as the first word or right before a link, so captions like
+# "check out this music video" don't trigger it
+AUDIO_KEYWORDS = ("audio", "mp3")
 
-async def handle_message_update(value):
+URL_PATTERN = re.compile(r"https?://[^\s<>\"']+")
+
+def parse_message_text(message_text: str) -> tuple:
+    """Pull every URL out of a message and detect whether audio-only mode was requested"""
+    words = message_text.split()
+    audio_only = any(
+        word.lower().strip("/#!:") in AUDIO_KEYWORDS
+        and (i == 0 or (i + 1 < len(words) and URL_PATTERN.match(words[i + 1])))
+        for i, word in enumerate(words)
+    )
+    urls = [url.rstrip(".,;:!?)]") for url in URL_PATTERN.findall(message_text)]
+    # Drop duplicates while keeping the order the user sent them in
+    return list(dict.fromkeys(urls)), audio_only
+
+def format_wait(seconds: float) -> str:
+    if seconds < 90:
+        return f"{max(1, round(seconds))} seconds"
+    return f"{round(seconds / 60)} minutes"
+
+async def admit_download(from_number: str, url: str, audio_only: bool, notify_queued):
+    """Reserve disk and bandwidth for a download, queueing or refusing it when the box is busy"""
+    ticket = admission.try_admit(audio_only)
+    if ticket:
+        return ticket
+    wait = admission.estimate_wait_seconds(admission.estimate_job_mb(audio_only))
+    print(f"Admission delayed for {url}: estimated wait {wait}, state {admission.stats()}")
+    if wait is not None and wait > ADMISSION_MAX_WAIT_SECONDS:
+        retry = "later" if wait == float("inf") else f"in about {format_wait(wait)}"
+        queue_message(from_number, f"🚦 The server is busy right now. Please send {url} again {retry}.")
+        return None
+    notify_queued(wait)
     try:
-        messages = value.get("messages", [])
-        for message in messages:
-            if message.get("type") == "text":
-                from_number = message["from"]
-                message_text = message["text"]["body"]
-                if "http" in message_text.lower():
-                    url = message_text.strip()
-                    print(f"\nReceived URL: {url}")
-                    # First validate URL
-                    is_valid = (
-                        url.startswith('https://www.youtube.com') or 
-                        url.startswith('https://youtube.com') or 
-                        url.startswith('https://youtu.be') or
-                        url.startswith('https://www.facebook.com') or 
-                        url.startswith('https://facebook.com') or
-                        url.startswith('https://fb.watch') or
-                        'facebook.com/share' in url
-                    )
-                    if not is_valid:
-                        print(f"Invalid URL format: {url}")
-                        send_message(from_number, "❌ Please send a valid YouTube or Facebook video URL")
-                        return
-                    send_message(from_number, "📥 Downloading video...")
-                    try:
-                        local_path, file_size = await download_video(url, youtube_cookies_path, facebook_cookies_path)
-                        if not local_path or not os.path.exists(local_path):
-                            print(f"Failed to download video from URL: {url}")
-                            # Check if it's a Facebook checkpoint issue
-                            if "checkpoint" in url.lower() or "facebook.com/checkpoint" in url.lower():
-                                send_message(from_number, "❌ Facebook security checkpoint detected. This video requires authentication.\n\nPlease try:\n• Making sure the video is public\n• Using a direct video link instead of a share link\n• Checking if the video is still available")
-                            else:
-                                send_message(from_number, "❌ Could not download video. For Facebook videos, please make sure:\n\n1. The video is public\n2. You're sharing the direct video URL\n3. The video hasn't been deleted")
-                            return
-                        print(f"Downloaded file: {local_path} ({file_size:.2f} MB)")
-                        cloudinary_url = None
-                        video_sent_to_chat = False
-                        
-                        if file_size < 16:
-                            print(f"Video is {file_size:.2f} MB - attempting to send directly to chat...")
-                            # Upload to Cloudinary in parallel
-                            upload_task = asyncio.create_task(async_upload_to_cloudinary(local_path))
-                            try:
-                                await send_video(from_number, local_path)
-                                video_sent_to_chat = True
-                                print(f"✅ Video sent successfully to chat!")
-                                send_message(from_number, "🎥 Here's your video! Uploading to Cloudinary for a shareable link...")
-                            except Exception as e:
-                                print(f"❌ Error sending video directly: {str(e)}")
-                                send_message(from_number, f"⚠️ Could not send video directly ({file_size:.2f} MB). Uploading to Cloudinary...")
-                            
-                            # Wait for Cloudinary upload to finish
-                            try:
-                                cloudinary_url, _ = await upload_task
-                                print(f"Cloudinary upload complete: {cloudinary_url}")
-                            except Exception as e:
-                                print(f"Cloudinary upload failed: {str(e)}")
-                                cloudinary_url = None
-                        else:
-                            print(f"Video is {file_size:.2f} MB - too large for direct chat, uploading to Cloudinary only...")
-                            # Only upload to Cloudinary
-                            try:
-                                cloudinary_url, _ = await async_upload_to_cloudinary(local_path)
-                                print(f"Cloudinary upload complete: {cloudinary_url}")
-                                # Delete local file after upload
-                                os.remove(local_path)
-                            except Exception as e:
-                                print(f"Cloudinary upload failed: {str(e)}")
-                                cloudinary_url = None
-                        
-                        # Always send Cloudinary link if available
-                        if cloudinary_url:
-                            if video_sent_to_chat:
-                                message = f"☁️ Cloudinary Link ({file_size:.2f} MB):\n{cloudinary_url}"
-                            else:
-                                message = f"☁️ Cloudinary Link ({file_size:.2f} MB):\n{cloudinary_url}\n\nNote: Video was too large to send directly in chat."
-                            send_message(from_number, message)
-                        else:
-                            if video_sent_to_chat:
-                                send_message(from_number, "✅ Video sent to chat! (Cloudinary upload failed)")
-                            else:
-                                send_message(from_number, "❌ Error: Could not upload to Cloudinary.")
-                        return
-                    except Exception as e:
-                        print(f"Error downloading video: {str(e)}")
-                        error_msg = str(e).lower()
-                        if "checkpoint" in error_msg or "unsupported url" in error_msg:
-                            send_message(from_number, "❌ Facebook security checkpoint detected. This video requires authentication.\n\nPlease try:\n• Making sure the video is public\n• Using a direct video link instead of a share link\n• Checking if the video is still available")
-                        else:
-                            send_message(from_number, "❌ Error downloading video. Please check if the video is accessible.")
-                        return
-                else:
-                    help_message = """👋 Welcome to WA Video Downloader!
-                    
+        return await admission.admit(audio_only)
+    except asyncio.TimeoutError:
+        queue_message(from_number, f"🚦 The server is still busy. Please send {url} again later.")
+        return None
+
+async def timed_cloudinary_upload(local_path: str, file_size: float):
+    """Upload to Cloudinary, feeding the upload time into the delivery planner"""
+    started = time.perf_counter()
+    try:
+        cloudinary_url, _ = await async_upload_to_cloudinary(local_path)
+    except Exception as e:
+        print(f"Cloudinary upload failed: {str(e)}")
+        return None
+    delivery_planner.observe_upload("cloudinary", file_size, time.perf_counter() - started)
+    print(f"Cloudinary upload complete: {cloudinary_url}")
+    return cloudinary_url
+
+async def send_to_chat(from_number: str, path: str, audio_only: bool) -> float:
+    """Send a file as chat media and return how long the WhatsApp upload and send took"""
+    # Status messages already queued for this chat must arrive before the media
+    await outbox.flush(from_number)
+    started = time.perf_counter()
+    if audio_only:
+        await send_audio(from_number, path)
+    else:
+        await send_video(from_number, path)
+    return time.perf_counter() - started
+
+async def deliver(from_number: str, local_path: str, file_size: float, audio_only: bool):
+    """Send a downloaded file the way the planner expects to reach a playable result first"""
+    media_label = "audio" if audio_only else "video"
+    duration = await probe_duration(local_path)
+    plan = delivery_planner.choose(file_size, duration, audio_only)
+    # Timed from the decision, like the predictions it is compared against
+    started = time.perf_counter()
+    # The shareable link is always sent, so the Cloudinary upload starts straight away
+    upload_task = asyncio.create_task(timed_cloudinary_upload(local_path, file_size))
+    chat_path, chat_size = local_path, file_size
+    first_playable = None
+    delivered = "link"
+
+    if plan.mode == "transcode":
+        print(f"Video is {file_size:.2f} MB - transcoding to {plan.video_kbps} kbps for chat...")
+        queue_message(from_number, f"🎞️ Video is {file_size:.2f} MB - compressing it so it can be sent in chat...")
+        transcode_started = time.perf_counter()
+        chat_path, chat_size = await transcode_for_chat(local_path, plan.video_kbps, TRANSCODE_AUDIO_KBPS)
+        if chat_path:
+            delivery_planner.observe_transcode(duration, time.perf_counter() - transcode_started)
+            print(f"Transcoded to {chat_size:.2f} MB: {chat_path}")
+            if chat_size >= WHATSAPP_MEDIA_LIMIT_MB:
+                os.remove(chat_path)
+                chat_path = None
+
+    if plan.mode in ("direct", "transcode") and chat_path:
+        print(f"Sending {media_label} ({chat_size:.2f} MB) directly to chat...")
+        try:
+            send_seconds = await send_to_chat(from_number, chat_path, audio_only)
+            if audio_only:
+                queue_message(from_number, "🎵 Here's your audio! Uploading to Cloudinary for a shareable link...")
+            else:
+                queue_message(from_number, "🎥 Here's your video! Uploading to Cloudinary for a shareable link...")
+            delivery_planner.observe_upload("whatsapp", chat_size, send_seconds)
+            first_playable = time.perf_counter() - started
+            delivered = plan.mode
+            print(f"✅ {media_label.capitalize()} sent successfully to chat!")
+        except Exception as e:
+            print(f"❌ Error sending {media_label} directly: {str(e)}")
+            queue_message(from_number, f"⚠️ Could not send {media_label} directly ({chat_size:.2f} MB). Uploading to Cloudinary...")
+        finally:
+            if chat_path != local_path and os.path.exists(chat_path):
+                os.remove(chat_path)
+    else:
+        print(f"{media_label.capitalize()} is {file_size:.2f} MB - delivering as a Cloudinary link only...")
+
+    cloudinary_url = await upload_task
+    if delivered == "link" and cloudinary_url:
+        # Same basis as the link prediction, which counts the user opening the link
+        first_playable = time.perf_counter() - started + LINK_OPEN_SECONDS
+        # Nothing will be served from the local copy once the link exists
+        os.remove(local_path)
+    elif delivered == "link" and plan.mode == "link" and file_size < WHATSAPP_MEDIA_LIMIT_MB:
+        # The planner skipped chat for speed, but a file that fits must still reach the user
+        print(f"Cloudinary upload failed - sending {media_label} ({file_size:.2f} MB) to chat instead...")
+        try:
+            await send_to_chat(from_number, local_path, audio_only)
+            first_playable = time.perf_counter() - started
+            delivered = "direct (link failed)"
+            print(f"✅ {media_label.capitalize()} sent successfully to chat!")
+        except Exception as e:
+            print(f"❌ Error sending {media_label} directly: {str(e)}")
+    delivery_planner.record(plan, first_playable, delivered if first_playable is not None else "failed")
+
+    if cloudinary_url:
+        if delivered != "link":
+            message = f"☁️ Cloudinary Link ({file_size:.2f} MB):\n{cloudinary_url}"
+        elif file_size < WHATSAPP_MEDIA_LIMIT_MB and plan.mode == "link":
+            message = f"☁️ Cloudinary Link ({file_size:.2f} MB):\n{cloudinary_url}\n\nNote: The link was expected to be ready sooner than sending the {media_label} in chat."
+        else:
+            message = f"☁️ Cloudinary Link ({file_size:.2f} MB):\n{cloudinary_url}\n\nNote: {media_label.capitalize()} was too large to send directly in chat."
+        queue_message(from_number, message)
+    elif delivered != "link":
+        queue_message(from_number, f"✅ {media_label.capitalize()} sent to chat! (Cloudinary upload failed)")
+    else:
+        queue_message(from_number, "❌ Error: Could not upload to Cloudinary.")
+
+async def process_url(from_number: str, url: str, audio_only: bool, notify_queued):
+    """Download a single URL and deliver the result to the chat as soon as it is ready"""
+    media_label = "audio" if audio_only else "video"
+    ticket = await admit_download(from_number, url, audio_only, notify_queued)
+    if not ticket:
+        return
+    try:
+        local_path, file_size = None, None
+        try:
+            local_path, file_size = await download_video(url, audio_only=audio_only, on_start=ticket.mark_started)
+        finally:
+            await admission.release(ticket, file_size)
+        if not local_path or not os.path.exists(local_path):
+            print(f"Failed to download video from URL: {url}")
+            # Check if it's a Facebook checkpoint issue
+            if "checkpoint" in url.lower() or "facebook.com/checkpoint" in url.lower():
+                queue_message(from_number, "❌ Facebook security checkpoint detected. This video requires authentication.\n\nPlease try:\n• Making sure the video is public\n• Using a direct video link instead of a share link\n• Checking if the video is still available")
+            else:
+                queue_message(from_number, f"❌ Could not download {url}\n\nFor Facebook videos, please make sure:\n\n1. The video is public\n2. You're sharing the direct video URL\n3. The video hasn't been deleted")
+            return
+        print(f"Downloaded file: {local_path} ({file_size:.2f} MB)")
+        await deliver(from_number, local_path, file_size, audio_only)
+    except Exception as e:
+        print(f"Error downloading {media_label}: {str(e)}")
+        error_msg = str(e).lower()
+        if "checkpoint" in error_msg or "unsupported url" in error_msg:
+            queue_message(from_number, "❌ Facebook security checkpoint detected. This video requires authentication.\n\nPlease try:\n• Making sure the video is public\n• Using a direct video link instead of a share link\n• Checking if the video is still available")
+        else:
+            queue_message(from_number, f"❌ Error downloading {url}. Please check if the video is accessible.")
+
+async def handle_urls(from_number: str, urls: list, audio_only: bool):
+    """Expand playlists and download every link in a message concurrently"""
+    media_label = "audio" if audio_only else "video"
+    supported = []
+    for url in urls:
+        classified = classify_url(url)
+        if classified:
+            supported.append(classified)
+        else:
+            print(f"Invalid URL format: {url}")
+    if not supported:
+        queue_message(from_number, "❌ Please send a valid YouTube or Facebook video URL")
+        return
+    if len(supported) > MAX_URLS_PER_MESSAGE:
+        queue_message(from_number, f"⚠️ Only the first {MAX_URLS_PER_MESSAGE} links will be downloaded.")
+        supported = supported[:MAX_URLS_PER_MESSAGE]
+
+    candidates = []
+    for classified in supported:
+        if classified.is_playlist:
+            try:
+                entries = await expand_playlist(classified.url)
+                print(f"Playlist {classified.url} expanded to {len(entries)} videos")
+                candidates.extend(filter(None, map(classify_url, entries)))
+            except Exception as e:
+                print(f"Error expanding playlist {classified.url}: {str(e)}")
+                queue_message(from_number, f"❌ Could not read playlist {classified.url}")
+        else:
+            candidates.append(classified)
+    # The same video shared with different tracking parameters is only downloaded once
+    jobs = list({classified.cache_key: classified.url for classified in candidates}.values())
+    if not jobs:
+        return
+
+    if len(jobs) == 1:
+        queue_message(from_number, f"📥 Downloading {media_label}...")
+    else:
+        queue_message(from_number, f"📥 Downloading {len(jobs)} {media_label} files... each one will be sent as soon as it's ready.")
+    queued_notice_sent = False
+
+    def notify_queued(wait):
+        # One notice per message, however many of its links end up waiting
+        nonlocal queued_notice_sent
+        if queued_notice_sent:
+            return
+        queued_notice_sent = True
+        estimate = f" (estimated wait: {format_wait(wait)})" if wait else ""
+        waiting = "some of your downloads are" if len(jobs) > 1 else f"your {media_label} is"
+        queue_message(from_number, f"⏳ Lots of downloads in progress - {waiting} queued{estimate}.")
+
+    # Each job delivers its own result; the download semaphore bounds real concurrency
+    await asyncio.gather(*(
+        process_url(from_number, url, audio_only, notify_queued)
+        for url in jobs
+    ))
+    # Deliver the final replies before the queued job counts as done
+    await outbox.flush(from_number)
+
+async def handle_message_update(value):
+    """Process one webhook update; errors propagate so a queued job is marked failed and retried"""
+    messages = value.get("messages", [])
+    for message in messages:
+        if message.get("type") == "text":
+            from_number = message["from"]
+            message_text = message["text"]["body"]
+            if "http" in message_text.lower():
+                urls, audio_only = parse_message_text(message_text)
+                print(f"\nReceived URLs: {urls} (mode: {'audio' if audio_only else 'video'})")
+                await handle_urls(from_number, urls, audio_only)
+                return
+            else:
+                help_message = """👋 Welcome to WA Video Downloader!
+                
 Just send me a Facebook or YouTube video URL, and I'll download it for you.
 
 Supported platforms:
 • Facebook
 • YouTube
 
-Note: Videos under 16MB will be sent directly in chat. For all videos, you'll get a Cloudinary link."""
-                    send_message(from_number, help_message)
-    except Exception as e:
-        print(f"Error in handle_message_update: {str(e)}")
-        print(f"Full error details: {type(e).__name__}: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+Send several links (or a YouTube playlist) in one message and they'll be downloaded together.
+
+Only want the sound? Add "audio" before the link (e.g. audio https://youtu.be/...) and I'll send just the audio track.
+
+Note: Videos are sent in chat when that's quickest - larger ones may be compressed first, or sent only as a link. For all videos, you'll get a Cloudinary link."""
+                queue_message(from_number, help_message)
+                await outbox.flush(from_number)
 
 @router.get("/", 
     response_model=Dict[str, str],
@@ -362,7 +518,13 @@ async def receive_webhook(request: Request):
                     message_cache.update({k: v for k, v in message_cache.items() 
                                        if current_time - v < MESSAGE_CACHE_TTL})
                 
-                await handle_message_update(value)
+                if WORKER_MODE == "inline":
+                    await handle_message_update(value)
+                elif await job_queue.enqueue(message_id, value):
+                    # Acknowledge right away; a worker picks the job up from the durable queue
+                    print(f"Queued message {message_id} for processing")
+                else:
+                    print(f"Message {message_id} is already queued. Skipping.")
         
         return WebhookResponse(status="ok")
     except Exception as e:
@@ -417,10 +579,97 @@ if os.getenv("DEV_MODE", "").lower() in ("true", "1", "yes"):
             raise HTTPException(status_code=400, detail="No URL provided")
         
         try:
-            local_path, file_size = await download_video(request.url, youtube_cookies_path, facebook_cookies_path)
+            local_path, file_size = await download_video(request.url, audio_only=request.audio_only)
             return TestDownloadResponse(
                 local_path=local_path,
                 file_size_mb=file_size
             )
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}") 
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}") 
+
+    @router.get("/debug/loop-stalls",
+        summary="Event Loop Stalls",
+        description="""
+        Reports event-loop lag and recent stalls above LOOP_STALL_THRESHOLD_MS, each with the
+        stack of the code that was blocking the loop. Only available when DEV_MODE is enabled.
+        """,
+        tags=["Development"])
+    async def loop_stalls():
+        """
+        Return the event-loop stall report.
+        
+        Returns:
+            dict: Threshold, maximum observed lag and the most recent stalls with their stacks
+        """
+        return loop_monitor.report()
+
+    @router.get("/debug/delivery",
+        summary="Delivery Decisions",
+        description="""
+        Reports the current upload latency/throughput estimates for WhatsApp and Cloudinary,
+        the transcode speed, and recent delivery decisions next to their observed
+        time-to-first-playable. Only available when DEV_MODE is enabled.
+        """,
+        tags=["Development"])
+    async def delivery_report():
+        """
+        Return the delivery planner's estimates and recent decisions.
+
+        Returns:
+            dict: Per-destination estimates, transcode speed and recent decisions with outcomes
+        """
+        return delivery_planner.report()
+
+    @router.post("/debug/profile/start",
+        summary="Start Sampling Profiler",
+        description="""
+        Starts a sampling profiler in the running service. By default only the event-loop
+        thread is sampled; pass `all_threads=true` to include download and upload threads.
+        Only available when DEV_MODE is enabled.
+        """,
+        tags=["Development"],
+        responses={
+            409: {
+                "description": "Profiler is already running"
+            }
+        })
+    async def start_profile(all_threads: bool = False):
+        """
+        Start sampling thread stacks.
+        
+        Args:
+            all_threads: Sample every thread instead of just the event loop
+            
+        Returns:
+            dict: Confirmation that profiling has started
+        """
+        try:
+            profiler.start(None if all_threads else threading.get_ident())
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return {"status": "profiling"}
+
+    @router.post("/debug/profile/stop",
+        summary="Stop Sampling Profiler",
+        description="""
+        Stops the sampling profiler and returns the profile in collapsed-stack format,
+        ready for flamegraph.pl or speedscope. Only available when DEV_MODE is enabled.
+        """,
+        tags=["Development"],
+        response_class=PlainTextResponse,
+        responses={
+            409: {
+                "description": "Profiler is not running"
+            }
+        })
+    async def stop_profile():
+        """
+        Stop the sampling profiler and return the collected profile.
+        
+        Returns:
+            PlainTextResponse: One line per unique stack with its sample count
+        """
+        try:
+            return PlainTextResponse(profiler.stop())
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
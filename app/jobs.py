@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import threading
+from typing import NamedTuple, Optional
+from config import JOB_QUEUE_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_SECONDS, WORKER_CONCURRENCY
+
+class Job(NamedTuple):
+    id: int
+    payload: dict
+    attempts: int
+    # Identifies this claim; once another worker re-claims the job, updates with it are ignored
+    lease: str
+
+class JobQueue:
+    """Durable SQLite job queue; claimed jobs are leased, so a crashed worker's jobs are retried"""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        # Wakes an in-process worker as soon as a job is enqueued instead of waiting for the next poll
+        self.job_available = asyncio.Event()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    message_id TEXT UNIQUE,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_until REAL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until)")
+            self._conn = conn
+        return self._conn
+
+    def _enqueue(self, message_id, payload):
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT OR IGNORE INTO jobs (message_id, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (message_id, json.dumps(payload), now, now),
+            )
+            return cursor.rowcount == 1
+
+    def _claim(self, owner):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            # IMMEDIATE takes the write lock up front so two processes never claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = conn.execute(
+                        """
+                        SELECT id, payload, attempts FROM jobs
+                        WHERE (status = 'pending' OR (status = 'running' AND lease_until < ?))
+                        ORDER BY id LIMIT 1
+                        """,
+                        (now,),
+                    ).fetchone()
+                    if row is None:
+                        conn.execute("COMMIT")
+                        return None
+                    job_id, payload, attempts = row
+                    if attempts < JOB_MAX_ATTEMPTS:
+                        break
+                    # Its lease expired too often (the worker keeps dying on it), so park it
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', last_error = 'lease expired too many times', updated_at = ? WHERE id = ?",
+                        (now, job_id),
+                    )
+                lease = f"{owner}:{uuid.uuid4().hex}"
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_owner = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                    (lease, now + JOB_LEASE_SECONDS, now, job_id),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return Job(job_id, json.loads(payload), attempts + 1, lease)
+
+    def _extend_lease(self, job_id, lease):
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (now + JOB_LEASE_SECONDS, now, job_id, lease),
+            )
+            return cursor.rowcount == 1
+
+    def _finish(self, job_id, lease, error=None):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            if error is None:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'done', lease_until = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                    (now, job_id, lease),
+                )
+            else:
+                cursor = conn.execute(
+                    """
+                    UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                        lease_until = NULL, last_error = ?, updated_at = ?
+                    WHERE id = ? AND lease_owner = ?
+                    """,
+                    (JOB_MAX_ATTEMPTS, error, now, job_id, lease),
+                )
+            return cursor.rowcount == 1
+
+    def _purge(self, older_than_seconds):
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+
+    def _counts(self):
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    # SQLite calls block, so the async API runs them in a thread
+
+    async def enqueue(self, message_id: Optional[str], payload: dict) -> bool:
+        """Store a job; returns False if a job for this message_id already exists"""
+        inserted = await asyncio.to_thread(self._enqueue, message_id, payload)
+        if inserted:
+            self.job_available.set()
+        return inserted
+
+    async def claim(self, owner: str) -> Optional[Job]:
+        return await asyncio.to_thread(self._claim, owner)
+
+    # These return False when the lease has been lost to another worker, and change nothing
+
+    async def extend_lease(self, job: Job) -> bool:
+        return await asyncio.to_thread(self._extend_lease, job.id, job.lease)
+
+    async def complete(self, job: Job) -> bool:
+        return await asyncio.to_thread(self._finish, job.id, job.lease)
+
+    async def fail(self, job: Job, error: str) -> bool:
+        return await asyncio.to_thread(self._finish, job.id, job.lease, error)
+
+    async def purge(self, older_than_seconds: float = 7 * 24 * 3600):
+        await asyncio.to_thread(self._purge, older_than_seconds)
+
+    async def counts(self) -> dict:
+        return await asyncio.to_thread(self._counts)
+
+job_queue = JobQueue()
+
+async def _keep_lease(job: Job):
+    """Renew the lease until cancelled; returns if the job has been claimed by another worker"""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            if not await job_queue.extend_lease(job):
+                print(f"Lost the lease on job {job.id}; another worker has claimed it")
+                return
+        except Exception as e:
+            # Keep renewing: letting the lease lapse would hand a running job to another worker
+            print(f"Error extending lease for job {job.id}: {str(e)}")
+
+async def _run_job(job: Job, handler, slots: asyncio.Semaphore):
+    print(f"Processing job {job.id} (attempt {job.attempts})")
+    heartbeat = asyncio.create_task(_keep_lease(job))
+    try:
+        await handler(job.payload)
+        if heartbeat.done() or not await job_queue.complete(job):
+            print(f"Job {job.id} finished after its lease was lost; leaving it to the new owner")
+        else:
+            print(f"Job {job.id} completed")
+    except Exception as e:
+        print(f"Job {job.id} failed: {str(e)}")
+        import traceback
+        print(f"Traceback: {traceback.format_exc()}")
+        if heartbeat.done() or not await job_queue.fail(job, str(e)):
+            print(f"Job {job.id} failed after its lease was lost; leaving it to the new owner")
+    finally:
+        heartbeat.cancel()
+        slots.release()
+
+async def run_worker(stop_event: asyncio.Event, concurrency: int = WORKER_CONCURRENCY, drain_timeout: float = 30):
+    """Claim and process queued webhook messages until stop_event is set"""
+    from app.endpoints import handle_message_update
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    slots = asyncio.Semaphore(concurrency)
+    # Strong references: the event loop only keeps weak ones, so a running job could be garbage-collected
+    running = set()
+    print(f"Job worker {owner} started (concurrency {concurrency}, queue {job_queue.path})")
+    while not stop_event.is_set():
+        await slots.acquire()
+        job_queue.job_available.clear()
+        try:
+            job = await job_queue.claim(owner)
+        except Exception as e:
+            print(f"Error claiming job: {str(e)}")
+            job = None
+        if job is None:
+            slots.release()
+            try:
+                await asyncio.wait_for(job_queue.job_available.wait(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        task = asyncio.create_task(_run_job(job, handle_message_update, slots))
+        running.add(task)
+        task.add_done_callback(running.discard)
+    if running:
+        print(f"Waiting up to {drain_timeout:.0f}s for {len(running)} running jobs to finish...")
+        await asyncio.wait(set(running), timeout=drain_timeout)
+    print(f"Job worker {owner} stopped; unfinished jobs will be resumed after their lease expires")
@@ -0,0 +1,133 @@
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque, Counter
+from datetime import datetime
+from typing import Optional
+from config import LOOP_MONITOR_INTERVAL_MS, LOOP_STALL_THRESHOLD_MS, PROFILER_INTERVAL_MS
+
+def _thread_stack(thread_id: int) -> list:
+    frame = sys._current_frames().get(thread_id)
+    return traceback.format_stack(frame) if frame else []
+
+class LoopStallMonitor:
+    """Measures event-loop lag; a watchdog thread snapshots the loop's stack while it is blocked"""
+
+    def __init__(self, interval_ms: int = LOOP_MONITOR_INTERVAL_MS, threshold_ms: int = LOOP_STALL_THRESHOLD_MS):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.stalls = deque(maxlen=50)
+        self.max_lag_ms = 0.0
+        self.ticks = 0
+        self._last_beat = time.perf_counter()
+        self._blocked_stack = None
+        self._loop_thread_id = None
+        self._running = False
+
+    async def run(self):
+        self._loop_thread_id = threading.get_ident()
+        # Startup may have taken a while; the watchdog must not count that as a stall
+        self._last_beat = time.perf_counter()
+        self._blocked_stack = None
+        self._running = True
+        threading.Thread(target=self._watchdog, name="loop-stall-watchdog", daemon=True).start()
+        try:
+            while self._running:
+                expected = time.perf_counter() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.perf_counter()
+                lag = now - expected
+                self._last_beat = now
+                self.ticks += 1
+                self.max_lag_ms = max(self.max_lag_ms, lag * 1000)
+                if lag >= self.threshold:
+                    stack, self._blocked_stack = self._blocked_stack, None
+                    self.stalls.append({
+                        "at": datetime.now().isoformat(timespec="seconds"),
+                        "duration_ms": round(lag * 1000, 1),
+                        "stack": stack or [],
+                    })
+                    print(f"⚠️ Event loop stalled for {lag * 1000:.0f} ms")
+                else:
+                    # A capture from a delay just under the threshold must not be blamed on the next stall
+                    self._blocked_stack = None
+        finally:
+            self._running = False
+
+    def _watchdog(self):
+        while self._running:
+            time.sleep(self.interval / 2)
+            silent_for = time.perf_counter() - self._last_beat
+            if silent_for > self.interval + self.threshold and self._blocked_stack is None:
+                # The loop is blocked right now: grab its stack before it moves on
+                self._blocked_stack = _thread_stack(self._loop_thread_id)
+
+    def stop(self):
+        self._running = False
+
+    def report(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "ticks": self.ticks,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "stalls": list(self.stalls),
+        }
+
+class SamplingProfiler:
+    """Samples thread stacks at a fixed interval and aggregates them into collapsed stacks"""
+
+    def __init__(self, interval_ms: int = PROFILER_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.samples = Counter()
+        self.sample_count = 0
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id: Optional[int] = None):
+        """Start sampling one thread, or every thread when thread_id is None"""
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+        self.samples.clear()
+        self.sample_count = 0
+        self.started_at = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, args=(thread_id,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and return the profile in collapsed-stack (flamegraph) format"""
+        if not self.running:
+            raise RuntimeError("Profiler is not running")
+        self._stop.set()
+        self._thread.join()
+        elapsed = time.perf_counter() - self.started_at
+        lines = [f"# {self.sample_count} samples over {elapsed:.1f}s every {self.interval * 1000:.0f} ms"]
+        lines += [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        return "\n".join(lines) + "\n"
+
+    def _sample(self, thread_id):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if thread_id is not None:
+                frames = {thread_id: frames[thread_id]} if thread_id in frames else {}
+            for tid, frame in frames.items():
+                if tid == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+loop_monitor = LoopStallMonitor()
+profiler = SamplingProfiler()
@@ -0,0 +1,86 @@
+import asyncio
+from collections import deque
+from app.whatsapp import send_message
+from config import OUTBOX_MAX_SENDS_PER_SECOND, OUTBOX_COALESCE_MS
+
+# WhatsApp rejects text bodies longer than this
+MAX_TEXT_LENGTH = 4096
+
+class Outbox:
+    """Sends status messages in the background, in order per recipient, coalescing bursts"""
+
+    def __init__(self, max_sends_per_second: float = OUTBOX_MAX_SENDS_PER_SECOND, coalesce_ms: int = OUTBOX_COALESCE_MS):
+        self.send_interval = 1 / max_sends_per_second
+        self.coalesce_delay = coalesce_ms / 1000
+        self._queues = {}
+        self._senders = {}
+        self._rate_lock = asyncio.Lock()
+        self._next_send_at = 0.0
+        self.sent = 0
+        self.coalesced = 0
+
+    def enqueue(self, to: str, message: str):
+        """Queue a text message without waiting for it to be delivered"""
+        self._queues.setdefault(to, deque()).append(message)
+        if to not in self._senders:
+            self._senders[to] = asyncio.create_task(self._drain(to))
+
+    async def flush(self, to: str):
+        """Wait until everything queued for a recipient has been sent, e.g. before sending media"""
+        while to in self._senders:
+            await asyncio.shield(self._senders[to])
+
+    async def close(self, timeout: float = 10):
+        """Give pending messages a chance to go out before shutdown"""
+        if self._senders:
+            await asyncio.wait(list(self._senders.values()), timeout=timeout)
+
+    async def _drain(self, to: str):
+        queue = self._queues[to]
+        try:
+            # A short pause lets a burst of status updates pile up into a single message
+            await asyncio.sleep(self.coalesce_delay)
+            while queue:
+                batch = [queue.popleft()]
+                while queue and len("\n\n".join(batch + [queue[0]])) <= MAX_TEXT_LENGTH:
+                    batch.append(queue.popleft())
+                self.coalesced += len(batch) - 1
+                await self._throttle()
+                await asyncio.to_thread(send_message, to, "\n\n".join(batch))
+                self.sent += 1
+        except asyncio.CancelledError:
+            print(f"Outbox sender for {to} cancelled with {len(queue)} messages unsent")
+            queue.clear()
+            raise
+        except Exception as e:
+            print(f"Error in outbox sender for {to}: {str(e)}")
+        finally:
+            del self._senders[to]
+            if queue:
+                # Messages queued after a failure get a fresh sender
+                self._senders[to] = asyncio.create_task(self._drain(to))
+            else:
+                del self._queues[to]
+
+    async def _throttle(self):
+        """Space sends out across all recipients to stay under the Graph API throughput limit"""
+        loop = asyncio.get_running_loop()
+        async with self._rate_lock:
+            now = loop.time()
+            if self._next_send_at > now:
+                await asyncio.sleep(self._next_send_at - now)
+            self._next_send_at = max(now, self._next_send_at) + self.send_interval
+
+    def stats(self) -> dict:
+        return {
+            "recipients_pending": len(self._queues),
+            "messages_pending": sum(len(queue) for queue in self._queues.values()),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+        }
+
+outbox = Outbox()
+
+def queue_message(to: str, message: str):
+    """Fire-and-forget replacement for send_message on the processing pipeline"""
+    outbox.enqueue(to, message)
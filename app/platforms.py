@@ -0,0 +1,90 @@
+import re
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = ("si", "feature", "pp", "fbclid", "mibextid", "rdid", "igshid", "share_url", "ref", "__tn__")
+
+class ClassifiedUrl(NamedTuple):
+    platform: str
+    url: str
+    video_id: Optional[str] = None
+    extractor_key: Optional[str] = None
+    is_playlist: bool = False
+    needs_resolve: bool = False
+
+    @property
+    def cache_key(self) -> str:
+        """Stable identifier for the media behind the URL, independent of how it was shared"""
+        return f"{self.platform}:{self.video_id or self.url}"
+
+class UrlPattern(NamedTuple):
+    regex: re.Pattern
+    extractor_key: Optional[str]
+    canonical: Optional[str] = None
+    is_playlist: bool = False
+    needs_resolve: bool = False
+
+_YOUTUBE_HOST = r"https?://(?:www\.|m\.|music\.)?youtube\.com"
+_FACEBOOK_HOST = r"https?://(?:www\.|m\.|web\.)?facebook\.com"
+
+# Checked in order, so more specific patterns come first. `extractor_key` is the
+# yt-dlp extractor to force; None means yt-dlp should probe (or the URL must be resolved first).
+PLATFORMS = {
+    "youtube": [
+        UrlPattern(re.compile(_YOUTUBE_HOST + r"/playlist\?(?:.*&)?list=(?P<id>[\w-]+)"),
+                   "YoutubeTab", "https://www.youtube.com/playlist?list={id}", is_playlist=True),
+        UrlPattern(re.compile(_YOUTUBE_HOST + r"/watch\?(?:.*&)?v=(?P<id>[\w-]{11})"),
+                   "Youtube", "https://www.youtube.com/watch?v={id}"),
+        UrlPattern(re.compile(_YOUTUBE_HOST + r"/(?:shorts|live|embed)/(?P<id>[\w-]{11})"),
+                   "Youtube", "https://www.youtube.com/watch?v={id}"),
+        UrlPattern(re.compile(r"https?://youtu\.be/(?P<id>[\w-]{11})"),
+                   "Youtube", "https://www.youtube.com/watch?v={id}"),
+        UrlPattern(re.compile(_YOUTUBE_HOST + r"/"), None),
+    ],
+    "facebook": [
+        UrlPattern(re.compile(_FACEBOOK_HOST + r"/reel/(?P<id>\d+)"),
+                   "FacebookReel", "https://www.facebook.com/reel/{id}"),
+        UrlPattern(re.compile(_FACEBOOK_HOST + r"/watch/?\?(?:.*&)?v=(?P<id>\d+)"),
+                   "Facebook", "https://www.facebook.com/watch/?v={id}"),
+        UrlPattern(re.compile(_FACEBOOK_HOST + r"/[^/?#]+/videos/(?:[^/?#]+/)?(?P<id>\d+)"),
+                   "Facebook", "https://www.facebook.com/watch/?v={id}"),
+        UrlPattern(re.compile(_FACEBOOK_HOST + r"/share/(?:[vr]/)?(?P<id>\w+)"),
+                   None, needs_resolve=True),
+        # yt-dlp's generic extractor follows fb.watch redirects itself, as it always has
+        UrlPattern(re.compile(r"https?://fb\.watch/(?P<id>[\w-]+)"), None),
+        UrlPattern(re.compile(_FACEBOOK_HOST + r"/"), None),
+    ],
+}
+
+def strip_tracking_params(url: str) -> str:
+    """Remove share-tracking query parameters and fragments from a URL"""
+    parts = urlsplit(url)
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith("utm_")
+    ]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+def classify_url(url: str) -> Optional[ClassifiedUrl]:
+    """Match a URL against the supported platforms, or return None if it is not supported"""
+    url = url.strip()
+    for platform, patterns in PLATFORMS.items():
+        for pattern in patterns:
+            match = pattern.regex.match(url)
+            if not match:
+                continue
+            video_id = match.groupdict().get("id")
+            if pattern.canonical:
+                canonical_url = pattern.canonical.format(id=video_id)
+            else:
+                canonical_url = strip_tracking_params(url)
+            return ClassifiedUrl(
+                platform=platform,
+                url=canonical_url,
+                video_id=None if pattern.needs_resolve else video_id,
+                extractor_key=pattern.extractor_key,
+                is_playlist=pattern.is_playlist,
+                needs_resolve=pattern.needs_resolve,
+            )
+    return None
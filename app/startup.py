@@ -0,0 +1,53 @@
+import time
+import asyncio
+import importlib
+
+# Phase name -> seconds, in the order the phases completed
+startup_phases = {}
+
+def record_phase(name: str, started_at: float):
+    """Record how long a startup phase took, given its perf_counter() start"""
+    startup_phases[name] = time.perf_counter() - started_at
+
+def startup_report() -> str:
+    """Format the recorded startup phases as a small table"""
+    lines = ["Startup time report:"]
+    for name, seconds in startup_phases.items():
+        lines.append(f"  {name:<40} {seconds * 1000:8.1f} ms")
+    lines.append(f"  {'total':<40} {sum(startup_phases.values()) * 1000:8.1f} ms")
+    return "\n".join(lines)
+
+def _timed_import(module_name: str):
+    started_at = time.perf_counter()
+    importlib.import_module(module_name)
+    record_phase(f"import {module_name} (background)", started_at)
+
+def _prewarm_downloaders():
+    from app.cookies import get_cookie_pool
+    from app.video import build_download_options
+    from app.ydl_pool import ydl_pool
+    identities = get_cookie_pool().identities
+    keys = [(identity.platform, identity.name, identity.path) for identity in identities]
+    for platform in ("youtube", "facebook"):
+        if not any(key[0] == platform for key in keys):
+            keys.append((platform, None, None))
+    for platform, name, cookies_path in keys:
+        ydl_pool.prewarm((platform, name, 'video'), build_download_options(cookies_path))
+
+async def warm_up():
+    """Load heavy modules and set up cookies once the server is already listening"""
+    from app.cookies import get_cookie_pool
+    # Give the server a moment to start listening before competing with it for the GIL
+    await asyncio.sleep(1)
+    try:
+        started_at = time.perf_counter()
+        await asyncio.to_thread(get_cookie_pool)
+        record_phase("load cookie identities (background)", started_at)
+        for module_name in ("yt_dlp", "cloudinary.uploader", "cloudinary.api"):
+            await asyncio.to_thread(_timed_import, module_name)
+        started_at = time.perf_counter()
+        await asyncio.to_thread(_prewarm_downloaders)
+        record_phase("prewarm yt-dlp instances (background)", started_at)
+    except Exception as e:
+        print(f"Error during background warm-up: {str(e)}")
+    print(startup_report())
@@ -1,12 +1,18 @@
 import os
 import asyncio
-import yt_dlp
 import requests
-import http.cookiejar
+from urllib.parse import urlparse
 from datetime import datetime
 from app.utils import sanitize_filename
+from app.platforms import classify_url
+from app.ydl_pool import ydl_pool
+from app.cookies import get_cookie_pool
+from config import AUDIO_CODEC, AUDIO_QUALITY, MAX_CONCURRENT_DOWNLOADS, MAX_PLAYLIST_ITEMS
 
-def resolve_facebook_share(url, cookies_path=None):
+# Caps how many yt-dlp downloads run at once across all chats
+download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+
+def resolve_facebook_share(url, cookies=None):
     # Rotate user agents to appear more human-like
     user_agents = [
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -32,15 +38,8 @@ def resolve_facebook_share(url, cookies_path=None):
         "Cache-Control": "max-age=0"
     }
     
-    cookies = None
-    if cookies_path and os.path.exists(cookies_path):
-        cj = http.cookiejar.MozillaCookieJar()
-        try:
-            cj.load(cookies_path, ignore_discard=True, ignore_expires=True)
-            cookies = {c.name: c.value for c in cj}
-            print(f"Loaded {len(cookies)} Facebook cookies")
-        except Exception as e:
-            print(f"Warning: Could not load cookies from {cookies_path}: {e}")
+    if cookies:
+        print(f"Using {len(cookies)} Facebook cookies")
     
     try:
         # Add a small delay to appear more human-like
@@ -50,93 +49,208 @@ def resolve_facebook_share(url, cookies_path=None):
         response = requests.get(url, headers=headers, cookies=cookies, allow_redirects=True, timeout=15)
         final_url = response.url
         
-        # Check for various Facebook security/checkpoint pages
-        if any(keyword in final_url.lower() for keyword in ['checkpoint', 'login', 'security']):
+        # Only a redirect to the checkpoint or login page means the account has been flagged;
+        # words like "bot" appear in ordinary page HTML, so the body is not inspected
+        path = urlparse(final_url).path.lower()
+        if path.startswith(('/checkpoint', '/login')):
             print(f"Warning: Facebook security checkpoint detected: {final_url}")
             raise Exception(f"Facebook security checkpoint detected: {final_url}")
-        
-        if any(keyword in response.text.lower() for keyword in ['robot', 'bot', 'security check', 'checkpoint']):
-            print(f"Warning: Facebook may be showing a security challenge page: {final_url}")
-            raise Exception(f"Facebook security challenge detected: {final_url}")
             
         return final_url
     except Exception as e:
         print(f"Error resolving Facebook share URL: {str(e)}")
         raise e
 
-async def download_video(url: str, YOUTUBE_COOKIES_PATH=None, FACEBOOK_COOKIES_PATH=None) -> tuple:
-    print(f"Starting download for URL: {url}")
-    DOWNLOAD_DELAY_SECONDS = 2
-    await asyncio.sleep(DOWNLOAD_DELAY_SECONDS)
-    cookies_path = None
-    if 'youtube.com' in url or 'youtu.be' in url:
-        cookies_path = YOUTUBE_COOKIES_PATH
-        if cookies_path:
-            print(f"Using YouTube cookies: {cookies_path}")
-    elif 'facebook.com' in url:
-        cookies_path = FACEBOOK_COOKIES_PATH
+def _expand_playlist_sync(url, limit):
+    classified = classify_url(url)
+    with get_cookie_pool().borrow(classified.platform if classified else None) as identity:
+        cookies_path = identity.path if identity else None
+        opts = {
+            'extract_flat': 'in_playlist',
+            'playlistend': limit,
+            'quiet': True,
+        }
         if cookies_path:
-            print(f"Using Facebook cookies: {cookies_path}")
-    if 'facebook.com/share' in url:
-        print("Detected Facebook share URL - attempting to resolve...")
-        try:
-            url = resolve_facebook_share(url, cookies_path)
-            print(f"Resolved share URL to: {url}")
-        except Exception as e:
-            print(f"Failed to resolve Facebook share URL: {str(e)}")
-            raise e
+            opts['cookiefile'] = cookies_path
+        with ydl_pool.acquire(('playlist', identity.name if identity else None, limit), opts) as ydl:
+            info = ydl.extract_info(
+                classified.url if classified else url,
+                download=False,
+                ie_key=classified.extractor_key if classified else None,
+            )
+    urls = []
+    for entry in (info or {}).get('entries') or []:
+        entry_url = entry.get('url') or entry.get('webpage_url')
+        if entry_url:
+            urls.append(entry_url)
+    return urls[:limit]
+
+async def expand_playlist(url: str, limit: int = MAX_PLAYLIST_ITEMS) -> list:
+    """Return the video URLs of the first `limit` playlist entries without downloading them"""
+    print(f"Expanding playlist: {url}")
+    return await asyncio.to_thread(_expand_playlist_sync, url, limit)
+
+def build_download_options(cookies_path=None, audio_only: bool = False) -> dict:
+    """yt-dlp options for a download job; pooled instances are keyed on the same inputs"""
     original_opts = {
         'format': 'best[ext=mp4]/bestvideo[ext=mp4]+bestaudio[ext=m4a]/best',
         'outtmpl': 'downloads/original_%(id)s.%(ext)s',
         'quiet': False,
         'no_warnings': False,
         'merge_output_format': 'mp4',
+        'noplaylist': True,
         'verbose': True,
         'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.70 Safari/537.36',
     }
+    if audio_only:
+        # Fetch only the audio stream, preferring one that needs no transcoding
+        original_opts['format'] = 'bestaudio[ext=m4a]/bestaudio/best' if AUDIO_CODEC == 'm4a' else 'bestaudio/best'
+        original_opts['outtmpl'] = 'downloads/audio_%(id)s.%(ext)s'
+        del original_opts['merge_output_format']
+        original_opts['postprocessors'] = [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': AUDIO_CODEC,
+            'preferredquality': AUDIO_QUALITY,
+        }]
     if cookies_path:
         original_opts['cookiefile'] = cookies_path
+    return original_opts
+
+async def download_video(url: str, audio_only: bool = False, on_start=None) -> tuple:
+    """Download a URL once a slot is free; on_start is called when the transfer itself begins"""
+    DOWNLOAD_DELAY_SECONDS = 2
+    # Pause before taking a slot, so the delay never leaves a download slot idle
+    await asyncio.sleep(DOWNLOAD_DELAY_SECONDS)
+    async with download_semaphore:
+        if on_start:
+            on_start()
+        # yt-dlp and the share URL resolver block, so keep them off the event loop
+        return await asyncio.to_thread(_download_video_sync, url, audio_only)
+
+def _download_video_sync(url, audio_only):
+    # Imported lazily: yt_dlp loads hundreds of extractor modules and dominates cold start
+    import yt_dlp
+    print(f"Starting download for URL: {url}")
+    classified = classify_url(url)
+    try:
+        # Spread jobs across cookie identities; a checkpoint error quarantines the one used
+        with get_cookie_pool().borrow(classified.platform if classified else None) as identity:
+            if identity:
+                print(f"Using {identity.platform} cookies: {identity.name}")
+            if classified and classified.needs_resolve:
+                print("Detected Facebook share URL - attempting to resolve...")
+                try:
+                    url = resolve_facebook_share(classified.url, identity.cookies if identity else None)
+                    print(f"Resolved share URL to: {url}")
+                except Exception as e:
+                    print(f"Failed to resolve Facebook share URL: {str(e)}")
+                    raise e
+                classified = classify_url(url)
+            extractor_key = None
+            if classified:
+                url = classified.url
+                extractor_key = classified.extractor_key
+                print(f"Classified as {classified.cache_key} (extractor: {extractor_key or 'auto'})")
+            pool_key = (
+                classified.platform if classified else None,
+                identity.name if identity else None,
+                'audio' if audio_only else 'video',
+            )
+            options = build_download_options(identity.path if identity else None, audio_only)
+            return _download_with_pool(url, extractor_key, pool_key, options, audio_only)
+    except yt_dlp.utils.DownloadError as e:
+        print(f"yt-dlp download error: {str(e)}")
+        if "requested format not available" in str(e).lower():
+            print("Video format not available - might be a private or deleted video")
+        elif "video is private" in str(e).lower():
+            print("Video is private")
+        elif "sign in to view" in str(e).lower():
+            print("Video requires authentication")
+    return None, None
+
+def _download_with_pool(url, extractor_key, pool_key, options, audio_only):
     original_path = None
+    # Pooled instances keep extractors initialised and the cookie jar parsed between jobs
+    with ydl_pool.acquire(pool_key, options) as ydl:
+        print("Downloading audio only..." if audio_only else "Downloading original version...")
+        # Forcing the extractor key skips yt-dlp's probe of every extractor
+        info = ydl.extract_info(url, download=True, ie_key=extractor_key)
+        if info:
+            downloaded_path = ydl.prepare_filename(info)
+            if info.get('requested_downloads'):
+                # Post-processors (audio extraction) may have changed the extension
+                downloaded_path = info['requested_downloads'][0].get('filepath', downloaded_path)
+            title = info.get('title', 'video')
+            sanitized_title = sanitize_filename(title)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            if audio_only:
+                extension = os.path.splitext(downloaded_path)[1] or f".{AUDIO_CODEC}"
+                new_filename = f"audio_{sanitized_title}_{timestamp}{extension}"
+            else:
+                new_filename = f"original_{sanitized_title}_{timestamp}.mp4"
+            new_path = os.path.join('downloads', new_filename)
+            if downloaded_path != new_path:
+                try:
+                    os.rename(downloaded_path, new_path)
+                    print(f"Renamed {downloaded_path} to {new_path}")
+                except Exception as e:
+                    print(f"Error renaming file: {str(e)}")
+                    try:
+                        import shutil
+                        shutil.copy2(downloaded_path, new_path)
+                        os.remove(downloaded_path)
+                        print(f"Copied and removed {downloaded_path} to {new_path}")
+                    except Exception as e2:
+                        print(f"Error copying file: {str(e2)}")
+                        new_path = downloaded_path
+                        print(f"Using original file: {downloaded_path}")
+            original_path = new_path
+            if os.path.exists(original_path):
+                orig_size = os.path.getsize(original_path) / (1024 * 1024)
+                print(f"Original download completed: {original_path} (Size: {orig_size:.2f} MB)")
+                return original_path, orig_size
+    return None, None
+
+def _probe_duration_sync(path):
+    import ffmpeg
     try:
-        with yt_dlp.YoutubeDL(original_opts) as ydl:
-            print("Downloading original version...")
-            try:
-                info = ydl.extract_info(url, download=True)
-                if info:
-                    downloaded_path = ydl.prepare_filename(info)
-                    title = info.get('title', 'video')
-                    sanitized_title = sanitize_filename(title)
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    new_filename = f"original_{sanitized_title}_{timestamp}.mp4"
-                    new_path = os.path.join('downloads', new_filename)
-                    if downloaded_path != new_path:
-                        try:
-                            os.rename(downloaded_path, new_path)
-                            print(f"Renamed {downloaded_path} to {new_path}")
-                        except Exception as e:
-                            print(f"Error renaming file: {str(e)}")
-                            try:
-                                import shutil
-                                shutil.copy2(downloaded_path, new_path)
-                                os.remove(downloaded_path)
-                                print(f"Copied and removed {downloaded_path} to {new_path}")
-                            except Exception as e2:
-                                print(f"Error copying file: {str(e2)}")
-                                new_path = downloaded_path
-                                print(f"Using original file: {downloaded_path}")
-                    original_path = new_path
-                    if os.path.exists(original_path):
-                        orig_size = os.path.getsize(original_path) / (1024 * 1024)
-                        print(f"Original download completed: {original_path} (Size: {orig_size:.2f} MB)")
-                        return original_path, orig_size
-            except yt_dlp.utils.DownloadError as e:
-                print(f"yt-dlp download error: {str(e)}")
-                if "requested format not available" in str(e).lower():
-                    print("Video format not available - might be a private or deleted video")
-                elif "video is private" in str(e).lower():
-                    print("Video is private")
-                elif "sign in to view" in str(e).lower():
-                    print("Video requires authentication")
+        return float(ffmpeg.probe(path)["format"]["duration"])
     except Exception as e:
-        print(f"Error downloading video: {str(e)}")
-    return None, None
+        print(f"Could not read duration of {path}: {str(e)}")
+        return None
+
+async def probe_duration(path: str):
+    """Media duration in seconds, or None if ffprobe can't tell"""
+    return await asyncio.to_thread(_probe_duration_sync, path)
+
+def _transcode_for_chat_sync(path, video_kbps, audio_kbps):
+    import ffmpeg
+    output_path = os.path.join('downloads', f"chat_{os.path.basename(path)}")
+    try:
+        (
+            ffmpeg
+            .input(path)
+            .output(
+                output_path,
+                vcodec='libx264',
+                preset='veryfast',
+                video_bitrate=f"{video_kbps}k",
+                maxrate=f"{video_kbps}k",
+                bufsize=f"{video_kbps * 2}k",
+                acodec='aac',
+                audio_bitrate=f"{audio_kbps}k",
+                movflags='+faststart',
+            )
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except Exception as e:
+        print(f"Error transcoding {path}: {str(e)}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return None, None
+    return output_path, os.path.getsize(output_path) / (1024 * 1024)
+
+async def transcode_for_chat(path: str, video_kbps: int, audio_kbps: int) -> tuple:
+    """Re-encode a video at the given bitrates so it fits WhatsApp's media limit"""
+    return await asyncio.to_thread(_transcode_for_chat_sync, path, video_kbps, audio_kbps)
@@ -1,9 +1,81 @@
 import os
 import json
+import uuid
+import asyncio
 import requests
 from config import WHATSAPP_TOKEN, WHATSAPP_API_URL, PHONE_NUMBER_ID
 
-def upload_media(file_path: str):
+# MIME types WhatsApp accepts for the files we produce
+MEDIA_MIME_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4a": "audio/mp4",
+    ".mp3": "audio/mpeg",
+    ".opus": "audio/ogg",
+    ".ogg": "audio/ogg",
+    ".aac": "audio/aac",
+}
+
+# Bytes read from disk per chunk while streaming an upload
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+class MultipartFileStream:
+    """multipart/form-data body that reads the file from disk in fixed-size chunks as it is sent"""
+
+    def __init__(self, file_path: str, fields: dict, file_field: str, mime_type: str, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        filename = os.path.basename(file_path).replace('"', "")
+        preamble = "".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        preamble += (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f'Content-Type: {mime_type}\r\n\r\n'
+        )
+        self._parts = [preamble.encode(), None, f"\r\n--{self.boundary}--\r\n".encode()]
+        self._file = open(file_path, "rb")
+        self._length = len(self._parts[0]) + os.fstat(self._file.fileno()).st_size + len(self._parts[2])
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        # requests uses this for Content-Length, so the body is not sent chunked
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        """Return at most one chunk; the HTTP client keeps calling until it gets b''"""
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        while self._parts:
+            part = self._parts[0]
+            if part is None:
+                data = self._file.read(size)
+                if data:
+                    return data
+                self._parts.pop(0)
+                continue
+            data, rest = part[:size], part[size:]
+            if rest:
+                self._parts[0] = rest
+            else:
+                self._parts.pop(0)
+            return data
+        return b""
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def upload_media(file_path: str, mime_type: str = None):
     """Upload a media file to WhatsApp and return the media ID"""
     try:
         file_size = os.path.getsize(file_path)
@@ -17,16 +89,13 @@ def upload_media(file_path: str):
         print(f"📤 Uploading file: {file_path}")
         print(f"🌐 Upload URL: {url}")
         
-        with open(file_path, "rb") as file:
-            # Get filename for proper MIME type detection
-            filename = os.path.basename(file_path)
-            
-            files = {
-                "file": (filename, file, "video/mp4"),  # Specify filename, file object, and MIME type
-                "messaging_product": (None, "whatsapp")
-            }
-            
-            response = requests.post(url, headers=headers, files=files, timeout=120)
+        if not mime_type:
+            mime_type = MEDIA_MIME_TYPES.get(os.path.splitext(file_path)[1].lower(), "video/mp4")
+
+        # Streamed from disk rather than built in memory by requests, so memory use doesn't grow with file size
+        with MultipartFileStream(file_path, {"messaging_product": "whatsapp"}, "file", mime_type) as body:
+            headers["Content-Type"] = body.content_type
+            response = requests.post(url, headers=headers, data=body, timeout=120)
             
             print(f"📡 Upload response status: {response.status_code}")
             
@@ -72,13 +141,22 @@ def send_message(to: str, message: str):
 
 async def send_video(to: str, video_path: str):
     """Send a video message via WhatsApp"""
+    await _send_media(to, video_path, "video")
+
+async def send_audio(to: str, audio_path: str):
+    """Send an audio message via WhatsApp"""
+    await _send_media(to, audio_path, "audio")
+
+async def _send_media(to: str, file_path: str, media_type: str):
+    """Upload a file and send it as a WhatsApp message of the given media type"""
     try:
-        print(f"Starting video upload process for {video_path}...")
-        media_id = upload_media(video_path)
+        print(f"Starting {media_type} upload process for {file_path}...")
+        # Uploads run in a thread so several can stream at once without blocking the event loop
+        media_id = await asyncio.to_thread(upload_media, file_path)
         if not media_id:
-            raise Exception("Failed to upload video to WhatsApp")
+            raise Exception(f"Failed to upload {media_type} to WhatsApp")
         
-        print(f"Video uploaded successfully with media_id: {media_id}")
+        print(f"{media_type.capitalize()} uploaded successfully with media_id: {media_id}")
         
         url = f"{WHATSAPP_API_URL}/{PHONE_NUMBER_ID}/messages"
         headers = {
@@ -88,22 +166,22 @@ async def send_video(to: str, video_path: str):
         data = {
             "messaging_product": "whatsapp",
             "to": to,
-            "type": "video",
-            "video": {"id": media_id}
+            "type": media_type,
+            media_type: {"id": media_id}
         }
         
-        print(f"Sending video message to {to}...")
+        print(f"Sending {media_type} message to {to}...")
         
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        response = await asyncio.to_thread(requests.post, url, headers=headers, json=data, timeout=30)
         
         if response.status_code != 200:
             print(f"❌ WhatsApp API error: HTTP {response.status_code}")
             print(f"❌ Response: {response.text}")
-            raise Exception(f"Failed to send video: HTTP {response.status_code} - {response.text}")
+            raise Exception(f"Failed to send {media_type}: HTTP {response.status_code} - {response.text}")
         else:
-            print(f"✅ Video message sent successfully!")
+            print(f"✅ {media_type.capitalize()} message sent successfully!")
             
     except Exception as e:
-        print(f"❌ Error sending video: {str(e)}")
+        print(f"❌ Error sending {media_type}: {str(e)}")
         print(f"❌ Full error details: {type(e).__name__}: {str(e)}")
         raise 
\ No newline at end of file
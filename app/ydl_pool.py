@@ -0,0 +1,81 @@
+import threading
+from contextlib import contextmanager
+from config import YDL_POOL_SIZE, YDL_POOL_MAX_USES
+
+class YoutubeDLPool:
+    """Warm yt_dlp.YoutubeDL instances keyed by (platform, cookies, mode).
+
+    An instance serves one job at a time and is recycled after `max_uses` jobs or on error.
+    """
+
+    def __init__(self, max_idle: int = YDL_POOL_SIZE, max_uses: int = YDL_POOL_MAX_USES):
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def acquire(self, key: tuple, options: dict):
+        """Borrow a YoutubeDL for `key`, creating one from `options` if none is idle"""
+        ydl, uses = self._take(key)
+        if ydl is None:
+            import yt_dlp
+            ydl = yt_dlp.YoutubeDL(options)
+            with self._lock:
+                self.created += 1
+        else:
+            with self._lock:
+                self.reused += 1
+        try:
+            yield ydl
+        except BaseException:
+            self._close(ydl)
+            raise
+        self._give_back(key, ydl, uses + 1)
+
+    def prewarm(self, key: tuple, options: dict):
+        """Build an idle instance ahead of the first job for `key`"""
+        with self.acquire(key, options):
+            pass
+
+    def _take(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+        return None, 0
+
+    def _give_back(self, key, ydl, uses):
+        if uses < self.max_uses:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append((ydl, uses))
+                    return
+        self._close(ydl)
+
+    def _close(self, ydl):
+        try:
+            ydl.close()
+        except Exception as e:
+            print(f"Error closing YoutubeDL instance: {str(e)}")
+
+    def clear(self):
+        """Close every idle instance, e.g. after cookie files have been replaced"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for instances in idle.values():
+            for ydl, _ in instances:
+                self._close(ydl)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "idle": sum(len(instances) for instances in self._idle.values()),
+            }
+
+ydl_pool = YoutubeDLPool()
@@ -11,8 +11,49 @@ BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
 FILE_RETENTION_HOURS = int(os.getenv('FILE_RETENTION_HOURS', '24'))
 MESSAGE_CACHE_TTL = 60
 CLOUDINARY_RETENTION_HOURS = int(os.getenv('CLOUDINARY_RETENTION_HOURS', '24'))
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', '2'))
+# Warm yt-dlp instances kept per (platform, cookies, mode) and jobs served before recycling
+YDL_POOL_SIZE = int(os.getenv('YDL_POOL_SIZE', str(MAX_CONCURRENT_DOWNLOADS)))
+YDL_POOL_MAX_USES = int(os.getenv('YDL_POOL_MAX_USES', '25'))
+MAX_URLS_PER_MESSAGE = int(os.getenv('MAX_URLS_PER_MESSAGE', '5'))
+MAX_PLAYLIST_ITEMS = int(os.getenv('MAX_PLAYLIST_ITEMS', '10'))
+# Admission control: keep this much disk free, cap MB being downloaded at once,
+# and reply "busy" instead of queueing when the estimated wait exceeds the limit
+MIN_FREE_DISK_MB = int(os.getenv('MIN_FREE_DISK_MB', '500'))
+MAX_INFLIGHT_MB = int(os.getenv('MAX_INFLIGHT_MB', '300'))
+ADMISSION_MAX_WAIT_SECONDS = int(os.getenv('ADMISSION_MAX_WAIT_SECONDS', '600'))
+DEFAULT_VIDEO_JOB_MB = float(os.getenv('DEFAULT_VIDEO_JOB_MB', '40'))
+DEFAULT_AUDIO_JOB_MB = float(os.getenv('DEFAULT_AUDIO_JOB_MB', '5'))
+# Extra cookie identities: files named youtube*.txt / facebook*.txt in COOKIES_DIR,
+# alongside YOUTUBE_COOKIES_CONTENT[_<n>] / FACEBOOK_COOKIES_CONTENT[_<n>] env vars
+COOKIES_DIR = os.getenv('COOKIES_DIR', '')
+COOKIES_RUNTIME_DIR = os.getenv('COOKIES_RUNTIME_DIR', 'cookies')
+COOKIE_QUARANTINE_MINUTES = int(os.getenv('COOKIE_QUARANTINE_MINUTES', '30'))
+# Webhook processing: "embedded" runs a job worker inside the web process, "external" only
+# enqueues (run `python worker.py` separately), "inline" processes inside the webhook request
+WORKER_MODE = os.getenv('WORKER_MODE', 'embedded').lower()
+WORKER_MODES = ('embedded', 'external', 'inline')
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '4'))
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', 'data/jobs.sqlite3')
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '120'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+# Outbound status messages: global send rate and how long to wait to merge a burst
+OUTBOX_MAX_SENDS_PER_SECOND = float(os.getenv('OUTBOX_MAX_SENDS_PER_SECOND', '20'))
+OUTBOX_COALESCE_MS = int(os.getenv('OUTBOX_COALESCE_MS', '300'))
+# Event-loop stall detection and the DEV_MODE sampling profiler
+LOOP_MONITOR_INTERVAL_MS = int(os.getenv('LOOP_MONITOR_INTERVAL_MS', '100'))
+LOOP_STALL_THRESHOLD_MS = int(os.getenv('LOOP_STALL_THRESHOLD_MS', '250'))
+PROFILER_INTERVAL_MS = int(os.getenv('PROFILER_INTERVAL_MS', '5'))
+# Audio-only mode: m4a keeps the original AAC stream when possible, mp3/opus transcode
+AUDIO_CODEC = os.getenv('AUDIO_CODEC', 'm4a')
+AUDIO_QUALITY = os.getenv('AUDIO_QUALITY', '96')
+# Delivery decisions and their observed outcomes are appended here (empty disables the file)
+DELIVERY_LOG_PATH = os.getenv('DELIVERY_LOG_PATH', 'data/delivery_log.jsonl')
 
 if not WHATSAPP_TOKEN:
     raise ValueError("WHATSAPP_TOKEN environment variable is required")
 if not PHONE_NUMBER_ID:
-    raise ValueError("WHATSAPP_PHONE_NUMBER_ID environment variable is required") 
\ No newline at end of file
+    raise ValueError("WHATSAPP_PHONE_NUMBER_ID environment variable is required")
+if WORKER_MODE not in WORKER_MODES:
+    raise ValueError(f"WORKER_MODE must be one of {', '.join(WORKER_MODES)}, got {WORKER_MODE!r}")
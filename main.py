@@ -1,3 +1,6 @@
+import time
+_import_started_at = time.perf_counter()
+
 import os
 import asyncio
 from contextlib import asynccontextmanager
@@ -9,10 +12,16 @@ from dotenv import load_dotenv
 # Import from app modules
 from app.endpoints import router
 from app.cleanup import cleanup_old_files
+from app.startup import record_phase, warm_up
+from app.monitor import loop_monitor
+from app.jobs import run_worker
+from app.outbox import outbox
 from config import (
-    BASE_URL, WHATSAPP_API_URL, PHONE_NUMBER_ID
+    BASE_URL, WHATSAPP_API_URL, PHONE_NUMBER_ID, WORKER_MODE
 )
 
+record_phase("import framework and app modules", _import_started_at)
+
 # Load environment variables
 load_dotenv()
 
@@ -33,12 +42,29 @@ async def lifespan(app: FastAPI):
     print(f"WHATSAPP_API_URL: {WHATSAPP_API_URL}")
     print(f"PHONE_NUMBER_ID: {PHONE_NUMBER_ID}")
     print(f"Development Mode: {'Enabled' if IS_DEV_MODE else 'Disabled'}")
+    print(f"Worker Mode: {WORKER_MODE}")
     print("\nStarting cleanup task...")
     asyncio.create_task(cleanup_old_files())
+    if WORKER_MODE != "external":
+        # Cookie setup and heavy imports (yt-dlp, Cloudinary) happen after the server is up.
+        # A web-only process never downloads, so it skips them and stays small
+        asyncio.create_task(warm_up())
+    asyncio.create_task(loop_monitor.run())
+    worker_stop = asyncio.Event()
+    worker_task = None
+    if WORKER_MODE == "embedded":
+        worker_task = asyncio.create_task(run_worker(worker_stop))
     print("Server started successfully!\n")
     yield
     # Shutdown
     print("Server shutting down...")
+    worker_stop.set()
+    if worker_task:
+        await worker_task
+    await outbox.close()
+    loop_monitor.stop()
+
+_app_setup_started_at = time.perf_counter()
 
 # Configure docs URLs based on development mode
 docs_url = "/docs" if IS_DEV_MODE else None
@@ -53,14 +79,19 @@ app = FastAPI(
     
     ## Features
     - Download videos from YouTube and Facebook
+    - Several links or a YouTube playlist per message, downloaded concurrently
+    - Audio-only mode: prefix a link with "audio" to receive just the audio track
     - Process videos with ffmpeg for optimal quality
-    - Send videos directly via WhatsApp (files < 16MB)
+    - Send videos directly via WhatsApp, compress oversized ones, or send a link - whichever is expected to be playable first
     - Upload to Cloudinary for shareable links
     - Automatic cleanup of old files
+    - Durable SQLite job queue so in-flight downloads survive restarts; downloads can run in a separate `worker.py` process
     
     ## Endpoints
     - `/webhook` - WhatsApp webhook for receiving messages
     - `/test-download` - Development endpoint for testing downloads (DEV_MODE only)
+    - `/debug/loop-stalls`, `/debug/profile/start`, `/debug/profile/stop` - Event-loop stall report and sampling profiler (DEV_MODE only)
+    - `/debug/delivery` - Upload estimates and recent delivery decisions (DEV_MODE only)
     - `/downloads/` - Static file serving for downloaded videos
     - `/privacy` - Privacy Policy page
     - `/terms` - Terms and Conditions page
@@ -115,4 +146,6 @@ os.makedirs("downloads", exist_ok=True)
 app.mount("/downloads", StaticFiles(directory="downloads"), name="downloads")
 
 # Include API routes
-app.include_router(router) 
\ No newline at end of file
+app.include_router(router)
+
+record_phase("create app and routes", _app_setup_started_at)
@@ -0,0 +1,30 @@
+import os
+import signal
+import asyncio
+
+from app.jobs import run_worker, job_queue
+from app.startup import warm_up
+from app.monitor import loop_monitor
+from app.outbox import outbox
+from config import WORKER_CONCURRENCY
+
+async def main():
+    """Run download jobs from the durable queue, separately from the web process"""
+    os.makedirs("downloads", exist_ok=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    print("\nWorker Configuration:")
+    print(f"JOB_QUEUE_PATH: {job_queue.path}")
+    print(f"WORKER_CONCURRENCY: {WORKER_CONCURRENCY}")
+    print(f"Pending jobs: {await job_queue.counts()}")
+    asyncio.create_task(warm_up())
+    asyncio.create_task(loop_monitor.run())
+    await run_worker(stop)
+    await outbox.close()
+    loop_monitor.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())